@@ -0,0 +1,79 @@
+"""
+Downloads and extracts GitHub repository archives.
+"""
+
+import os
+import shutil
+import subprocess
+import tempfile
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+from _crucible._http import get_with_backoff
+
+# Chunk size used when copying the response body into the buffer
+COPY_BUFFER_SIZE = 1024 * 1024
+
+def extract_zip(zip_ref, dest_dir):
+    """Extract all members of a zip archive, inflating files in parallel."""
+    files = [member for member in zip_ref.infolist() if not member.is_dir()]
+    # Create every directory up front so worker threads never race on mkdir
+    dest_root = os.path.abspath(dest_dir)
+    parents = {os.path.dirname(member.filename) for member in zip_ref.infolist()}
+    parents.update(member.filename for member in zip_ref.infolist() if member.is_dir())
+    for parent in parents:
+        parent_dir = os.path.normpath(os.path.join(dest_root, parent))
+        if parent_dir.startswith(dest_root + os.sep):
+            os.makedirs(parent_dir, exist_ok=True)
+    # zlib releases the GIL while inflating, and ZipFile serializes reads of the
+    # underlying file itself, so members can be extracted from several threads
+    with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+        list(executor.map(lambda member: zip_ref.extract(member, dest_dir), files))
+
+def extract_zip_native(bsdtar, zip_file, dest_dir):
+    """Extract a zip archive with bsdtar, whose libarchive inflate and CRC32 run entirely in C."""
+    result = subprocess.run([bsdtar, "-xf", "-", "-C", dest_dir], stdin=zip_file, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise Exception(f"bsdtar failed: {result.stderr.strip()}")
+
+def download_repo_contents(session, org, repo, sha, target_dir):
+    """Download repository contents as a zip file and extract to target directory.
+
+    Requests are made through the given requests.Session, so that concurrent
+    downloads share its connection pool.
+    """
+    # Extract next to target_dir, so that moving the result into place is a rename
+    # on the same filesystem rather than a recursive copy out of /tmp
+    parent_dir = os.path.dirname(os.path.abspath(target_dir))
+    with tempfile.TemporaryDirectory(prefix=".crucible-", dir=parent_dir) as temp_dir, \
+            tempfile.TemporaryFile() as zip_buffer:
+        zip_url = f"https://github.com/{org}/{repo}/archive/{sha}.zip"
+        print(f"Downloading {zip_url}...")
+        # Stream the archive into an anonymous temporary file instead of holding
+        # the whole body in memory and then writing it out to a named zip file.
+        # (SpooledTemporaryFile is not usable here: before Python 3.11 it lacks
+        # the seekable() method zipfile relies on.)
+        with get_with_backoff(zip_url, session=session, stream=True) as response:
+            if response.status_code != 200:
+                raise Exception(f"Failed to download {zip_url}: {response.status_code}")
+            response.raw.decode_content = True
+            shutil.copyfileobj(response.raw, zip_buffer, COPY_BUFFER_SIZE)
+        zip_buffer.seek(0)
+        with zipfile.ZipFile(zip_buffer, 'r') as zip_ref:
+            # GitHub archives hold everything under a single {repo}-{sha} directory
+            names = zip_ref.namelist()
+            if not names:
+                raise Exception(f"Archive for {repo} is empty")
+            extracted_dir = os.path.join(temp_dir, names[0].split('/', 1)[0])
+            # Prefer bsdtar when it is installed, falling back to zipfile otherwise
+            bsdtar = shutil.which("bsdtar")
+            if bsdtar:
+                zip_buffer.seek(0)
+                extract_zip_native(bsdtar, zip_buffer, temp_dir)
+            else:
+                extract_zip(zip_ref, temp_dir)
+        if not os.path.isdir(extracted_dir):
+            raise Exception(f"Could not find extracted directory for {repo}")
+        if os.path.exists(target_dir):
+            shutil.rmtree(target_dir)
+        os.replace(extracted_dir, target_dir)
@@ -0,0 +1,70 @@
+"""
+Shared HTTP session for talking to GitHub.
+
+All requests go through a single pooled requests.Session, so TLS connections to
+github.com and api.github.com are reused instead of being set up for every call.
+"""
+
+import os
+import random
+import subprocess
+import time
+from functools import lru_cache
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Size of the per-host connection pool; at least the number of concurrent downloads
+POOL_SIZE = 16
+# Retries (with exponential backoff) when GitHub rate limits a request
+MAX_RETRIES = 5
+
+SESSION = requests.Session()
+SESSION.mount("https://", HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE))
+
+@lru_cache(maxsize=None)
+def github_token():
+    """Return a GitHub token from the environment or the gh CLI, or None if there is none."""
+    token = os.environ.get("GITHUB_TOKEN") or os.environ.get("GH_TOKEN")
+    if token:
+        return token
+    try:
+        result = subprocess.run(["gh", "auth", "token"], capture_output=True, text=True)
+    except FileNotFoundError:
+        return None
+    if result.returncode != 0:
+        return None
+    return result.stdout.strip() or None
+
+def api_headers():
+    """Headers for GitHub REST and GraphQL API requests."""
+    headers = {"Accept": "application/vnd.github+json"}
+    token = github_token()
+    if token:
+        headers["Authorization"] = f"Bearer {token}"
+    return headers
+
+def request_with_backoff(method, url, session=None, **kwargs):
+    """Make a request, backing off and retrying while GitHub answers 429 Too Many Requests.
+
+    Uses the shared SESSION unless another requests.Session is given.
+    """
+    session = session or SESSION
+    for attempt in range(MAX_RETRIES):
+        response = session.request(method, url, **kwargs)
+        if response.status_code != 429:
+            return response
+        response.close()
+        retry_after = response.headers.get('Retry-After')
+        if retry_after and retry_after.isdigit():
+            delay = int(retry_after)
+        else:
+            # Jitter keeps concurrent requests from retrying in lockstep
+            delay = 2 ** attempt + random.uniform(0, 1)
+        print(f"Rate limited fetching {url}, retrying in {delay:.1f}s...")
+        time.sleep(delay)
+    return response
+
+def get_with_backoff(url, session=None, **kwargs):
+    """GET a URL with request_with_backoff."""
+    return request_with_backoff("GET", url, session, **kwargs)
@@ -0,0 +1,75 @@
+"""
+YAML loading and dumping shared by the crucible scripts.
+
+Uses PyYAML's libyaml-backed CSafeLoader/CSafeDumper when available, falling back
+to the pure Python SafeLoader/SafeDumper otherwise.
+"""
+
+import glob
+import hashlib
+import json
+import os
+import tempfile
+from functools import lru_cache
+
+import yaml
+
+try:
+    from yaml import CSafeLoader as SafeLoader, CSafeDumper as SafeDumper
+except ImportError:
+    # PyYAML was built without libyaml
+    from yaml import SafeLoader, SafeDumper
+
+# Directory (relative to the working directory) holding JSON copies of parsed YAML files
+CACHE_DIR = ".crucible-cache"
+
+def load(stream):
+    """Parse YAML from a string or file, like yaml.safe_load."""
+    return yaml.load(stream, Loader=SafeLoader)
+
+def dump(data, stream=None, **kwargs):
+    """Serialize data as YAML, like yaml.safe_dump."""
+    return yaml.dump(data, stream, Dumper=SafeDumper, **kwargs)
+
+def load_yaml_file(path):
+    """Parse a YAML file, reusing the previous result while the file is unchanged.
+
+    The cache is keyed on the file's modification time and size, so the returned
+    data is shared between callers and must not be mutated.
+    """
+    st = os.stat(path)
+    return _load_yaml_cached(os.path.abspath(path), st.st_mtime_ns, st.st_size)
+
+@lru_cache(maxsize=None)
+def _load_yaml_cached(path, mtime_ns, size):
+    with open(path, 'rb') as f:
+        source = f.read()
+    # The cache file name embeds a hash of the YAML source, so a stale copy is never read
+    digest = hashlib.blake2b(source, digest_size=8).hexdigest()
+    name = os.path.basename(path)
+    cache_path = os.path.join(CACHE_DIR, f"{name}.{digest}.json")
+    try:
+        with open(cache_path, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        pass
+    data = load(source)
+    _write_json_cache(cache_path, name, data)
+    return data
+
+def _write_json_cache(cache_path, name, data):
+    """Save data as JSON if it survives the round trip, replacing older copies of the same file."""
+    try:
+        text = json.dumps(data)
+        if json.loads(text) != data:
+            return
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        for stale in glob.glob(os.path.join(CACHE_DIR, f"{glob.escape(name)}.*.json")):
+            os.remove(stale)
+        fd, tmp_path = tempfile.mkstemp(dir=CACHE_DIR)
+        with os.fdopen(fd, 'w') as f:
+            f.write(text)
+        os.replace(tmp_path, cache_path)
+    except (OSError, TypeError, ValueError):
+        # The cache is only an optimization
+        pass
@@ -6,52 +6,44 @@ Usage:
   checkout.py -f file.yaml      # Read SHAs from specified file
   checkout.py --stdin           # Read YAML from stdin
   checkout.py                   # Use default branches from default_branches.py
+  checkout.py --reuse-branches  # Same, reusing default branches resolved in the last 5 minutes
 """
 
 import os
 import sys
-import yaml
-import requests
-import zipfile
-import tempfile
-import shutil
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 import argparse
 
-# Add the parent directory to sys.path so we can import _crucible.default_branches
+# Add the parent directory to sys.path so we can import _crucible modules
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from _crucible._download import download_repo_contents
+from _crucible._http import SESSION
+from _crucible import _yaml
+from _crucible._yaml import load_yaml_file
 from _crucible.default_branches import get_default_branches
 
-def download_repo_contents(org, repo, sha, target_dir):
-    """Download repository contents as a zip file and extract to target directory."""
-    with tempfile.TemporaryDirectory() as temp_dir:
-        zip_url = f"https://github.com/{org}/{repo}/archive/{sha}.zip"
-        zip_path = os.path.join(temp_dir, f"{repo}.zip")
-        print(f"Downloading {zip_url}...")
-        response = requests.get(zip_url)
-        if response.status_code != 200:
-            raise Exception(f"Failed to download {zip_url}: {response.status_code}")
-        with open(zip_path, 'wb') as f:
-            f.write(response.content)
-        with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-            zip_ref.extractall(temp_dir)
-        extracted_dir = None
-        for item in os.listdir(temp_dir):
-            if item.startswith(f"{repo}-"):
-                extracted_dir = os.path.join(temp_dir, item)
-                break
-        if not extracted_dir:
-            raise Exception(f"Could not find extracted directory for {repo}")
-        if os.path.exists(target_dir):
-            shutil.rmtree(target_dir)
-        shutil.move(extracted_dir, target_dir)
-
+# Maximum number of repositories downloaded concurrently
+MAX_CONCURRENT_DOWNLOADS = 8
 
+def checkout_repo(name, org, repo, sha):
+    """Download a single repository, returning an error message on failure or None on success."""
+    try:
+        target_dir = Path(name)
+        download_repo_contents(SESSION, org, repo, sha, target_dir)
+        print(f"  Downloaded {name} to {target_dir}")
+        return None
+    except Exception as e:
+        error_msg = f"  Error processing {name}: {e}"
+        print(error_msg)
+        return error_msg
 
 def main():
     parser = argparse.ArgumentParser(description="Check out repositories at specified SHAs")
     parser.add_argument('-f', '--file', type=str, help='YAML file containing repository SHAs')
     parser.add_argument('--stdin', action='store_true', help='Read YAML from stdin')
+    parser.add_argument('--reuse-branches', action='store_true',
+                        help='Reuse default branch SHAs resolved in the last 5 minutes instead of querying GitHub')
     
     args = parser.parse_args()
     
@@ -59,7 +51,7 @@ def main():
         # Read from specified file
         print(f"Reading repository SHAs from {args.file}...", file=sys.stderr)
         with open(args.file, 'r') as f:
-            repos_data = yaml.safe_load(f)
+            repos_data = _yaml.load(f)
     elif args.stdin:
         # Read from stdin
         print("Reading YAML from stdin...", file=sys.stderr)
@@ -67,21 +59,19 @@ def main():
         if not input_yaml.strip():
             print("Error: No YAML provided on stdin", file=sys.stderr)
             sys.exit(1)
-        repos_data = yaml.safe_load(input_yaml)
+        repos_data = _yaml.load(input_yaml)
     else:
         # Use default branches
         print("No file or stdin specified, using _crucible/default_branches.py to get default SHAs...", file=sys.stderr)
-        repos_data = get_default_branches()
+        repos_data = get_default_branches(reuse_cached=args.reuse_branches)
 
     # Load existing checkout info from disk if available (before any changes)
     existing_checkout = {}
     if os.path.exists("checkout.yaml"):
-        with open("checkout.yaml", "r") as f:
-            existing_checkout = yaml.safe_load(f) or {}
-
-    errors = []
+        existing_checkout = load_yaml_file("checkout.yaml") or {}
 
-    # For each repo, check out at the specified SHA if needed
+    # For each repo, work out whether it needs to be checked out at the specified SHA
+    to_checkout = []
     for name, info in repos_data.items():
         org = info['github_org']
         repo = info['github_repo']
@@ -91,19 +81,18 @@ def main():
             print(f"\nRepository {name} is already at SHA {sha}, skipping...")
             continue
         print(f"\nProcessing {name} ({org}/{repo}) at SHA {sha}...")
-        try:
-            target_dir = Path(name)
-            download_repo_contents(org, repo, sha, target_dir)
-            print(f"  Downloaded to {target_dir}")
-        except Exception as e:
-            error_msg = f"  Error processing {name}: {e}"
-            print(error_msg)
-            errors.append(error_msg)
-            continue
+        to_checkout.append((name, org, repo, sha))
+
+    # Downloads are network bound and independent, so run them concurrently
+    errors = []
+    if to_checkout:
+        with ThreadPoolExecutor(max_workers=min(MAX_CONCURRENT_DOWNLOADS, len(to_checkout))) as executor:
+            results = executor.map(lambda args: checkout_repo(*args), to_checkout)
+            errors = [err for err in results if err]
 
     # Write the desired YAML to checkout.yaml
     with open("checkout.yaml", 'w') as f:
-        yaml.dump(repos_data, f, default_flow_style=False, indent=2)
+        _yaml.dump(repos_data, f, default_flow_style=False, indent=2)
     print("\nCheckout information written to checkout.yaml")
     print("Repository contents have been downloaded to subdirectories.")
 
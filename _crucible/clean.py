@@ -3,17 +3,24 @@
 Deletes checkout.yaml and all directories corresponding to repos listed in crucible/repositories.yml.
 """
 import os
+import sys
 import shutil
-import yaml
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
+# Add the parent directory to sys.path so we can import _crucible modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from _crucible._yaml import CACHE_DIR, load_yaml_file
+
+# Maximum number of repository directories deleted concurrently
+MAX_CONCURRENT_DELETES = 8
+
 def main():
     repos_file = Path("_crucible/repositories.yml")
     if not repos_file.exists():
         print("repositories.yml not found in _crucible directory.")
         return
-    with open(repos_file, 'r') as f:
-        repos_data = yaml.safe_load(f)
+    repos_data = load_yaml_file(repos_file)
     # Delete checkout.yaml
     checkout_file = Path("checkout.yaml")
     if checkout_file.exists():
@@ -46,15 +53,28 @@ def main():
     else:
         print(f"{toolchain} does not exist, skipping.")
     
+    # Delete the cache directory
+    cache_dir = Path(CACHE_DIR)
+    if cache_dir.exists() and cache_dir.is_dir():
+        print(f"Deleting directory {cache_dir}")
+        shutil.rmtree(cache_dir)
+    else:
+        print(f"Directory {cache_dir} does not exist, skipping.")
+    
     # Delete each repo directory
+    repo_dirs = []
     for repo_info in repos_data:
         name = repo_info['name']
         repo_dir = Path(name)
         if repo_dir.exists() and repo_dir.is_dir():
             print(f"Deleting directory {repo_dir}")
-            shutil.rmtree(repo_dir)
+            repo_dirs.append(repo_dir)
         else:
             print(f"Directory {repo_dir} does not exist, skipping.")
+    # Deletion is dominated by unlink syscalls, which release the GIL
+    if repo_dirs:
+        with ThreadPoolExecutor(max_workers=min(MAX_CONCURRENT_DELETES, len(repo_dirs))) as executor:
+            list(executor.map(shutil.rmtree, repo_dirs))
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
@@ -3,17 +3,31 @@
 Outputs the current default branch SHAs for all repositories in crucible/repositories.yml as YAML to stdout.
 """
 
+import os
 import sys
-import yaml
-import subprocess
 import json
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
+# Add the parent directory to sys.path so we can import _crucible modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from _crucible._http import api_headers, get_with_backoff, github_token, request_with_backoff
+from _crucible import _yaml
+from _crucible._yaml import CACHE_DIR, load_yaml_file
+
+# Maximum number of repositories looked up concurrently through the REST API
+MAX_CONCURRENT_REQUESTS = 8
+# Resolved default branches can be reused for this many seconds
+BRANCH_CACHE_FILE = Path(CACHE_DIR) / "branches.json"
+BRANCH_CACHE_TTL = 5 * 60
+
 def gh_api(path):
-    result = subprocess.run(["gh", "api", path], capture_output=True, text=True)
-    if result.returncode != 0:
-        raise Exception(f"gh api {path} failed: {result.stderr.strip()}")
-    return json.loads(result.stdout)
+    url = f"https://api.github.com/{path}"
+    response = get_with_backoff(url, headers=api_headers())
+    if response.status_code != 200:
+        raise Exception(f"GET {url} failed: {response.status_code} {response.text.strip()}")
+    return response.json()
 
 def get_default_branch_sha(org, repo):
     repo_data = gh_api(f"repos/{org}/{repo}")
@@ -21,30 +35,107 @@ def get_default_branch_sha(org, repo):
     branch_data = gh_api(f"repos/{org}/{repo}/branches/{default_branch}")
     return branch_data['commit']['sha'], default_branch
 
-def get_default_branches():
+def get_default_branch_shas_graphql(repos):
+    """Look up the default branch SHAs of many repositories with a single GraphQL query.
+
+    Takes a list of (org, repo) pairs and returns a dict mapping each pair that could
+    be resolved to (sha, branch). GraphQL requires authentication, so without a token
+    nothing is resolved and callers fall back to the REST API.
+    """
+    if not repos or not github_token():
+        return {}
+    fields = [
+        f"r{i}: repository(owner: {json.dumps(org)}, name: {json.dumps(repo)}) "
+        "{ defaultBranchRef { name target { oid } } }"
+        for i, (org, repo) in enumerate(repos)
+    ]
+    query = "query { " + " ".join(fields) + " }"
+    try:
+        response = request_with_backoff("POST", "https://api.github.com/graphql",
+                                        json={"query": query}, headers=api_headers())
+        if response.status_code != 200:
+            raise Exception(f"{response.status_code} {response.text.strip()}")
+        data = response.json().get('data') or {}
+    except Exception as e:
+        print(f"Warning: GraphQL lookup of default branches failed: {e}", file=sys.stderr)
+        return {}
+    result = {}
+    for i, (org, repo) in enumerate(repos):
+        # Repositories GraphQL could not resolve come back as null
+        branch_ref = (data.get(f"r{i}") or {}).get('defaultBranchRef')
+        if branch_ref:
+            result[(org, repo)] = (branch_ref['target']['oid'], branch_ref['name'])
+    return result
+
+def load_branch_cache(repos_key):
+    """Return recently resolved default branches for this repositories.yml, or None."""
+    try:
+        with open(BRANCH_CACHE_FILE, 'r') as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(cache, dict) or not isinstance(cache.get('result'), dict):
+        return None
+    resolved_at = cache.get('time')
+    if not isinstance(resolved_at, (int, float)) or cache.get('repositories') != repos_key:
+        return None
+    age = time.time() - resolved_at
+    if not 0 <= age < BRANCH_CACHE_TTL:
+        return None
+    print(f"Reusing default branch SHAs resolved {int(age)}s ago", file=sys.stderr)
+    return cache.get('result')
+
+def save_branch_cache(repos_key, result):
+    """Record resolved default branches for this repositories.yml."""
+    try:
+        BRANCH_CACHE_FILE.parent.mkdir(exist_ok=True)
+        with open(BRANCH_CACHE_FILE, 'w') as f:
+            json.dump({'repositories': repos_key, 'time': time.time(), 'result': result}, f, indent=2)
+    except OSError as e:
+        print(f"Warning: Could not write {BRANCH_CACHE_FILE}: {e}", file=sys.stderr)
+
+def get_default_branches(reuse_cached=False):
+    """Resolve the default branch SHA of every repository in repositories.yml.
+
+    With reuse_cached, results resolved within the last BRANCH_CACHE_TTL seconds
+    are returned without contacting GitHub, as long as repositories.yml is unchanged.
+    """
     repos_file = Path("_crucible/repositories.yml")
     if not repos_file.exists():
         print("Error: repositories.yml not found in _crucible directory", file=sys.stderr)
         sys.exit(1)
-    with open(repos_file, 'r') as f:
-        repos_data = yaml.safe_load(f)
+    st = os.stat(repos_file)
+    repos_key = [st.st_mtime_ns, st.st_size]
+    if reuse_cached:
+        cached = load_branch_cache(repos_key)
+        if cached is not None:
+            return cached
+    repos_data = load_yaml_file(repos_file)
+    repos = [(repo_info['github_org'], repo_info['github_repo']) for repo_info in repos_data]
+    resolved = get_default_branch_shas_graphql(repos)
+    # Look up anything GraphQL could not resolve through the REST API, concurrently
+    unresolved = [key for key in repos if key not in resolved]
+    if unresolved:
+        with ThreadPoolExecutor(max_workers=min(MAX_CONCURRENT_REQUESTS, len(unresolved))) as executor:
+            resolved.update(zip(unresolved, executor.map(lambda key: get_default_branch_sha(*key), unresolved)))
     result = {}
     for repo_info in repos_data:
         name = repo_info['name']
         org = repo_info['github_org']
         repo = repo_info['github_repo']
-        sha, branch = get_default_branch_sha(org, repo)
+        sha, branch = resolved[(org, repo)]
         result[name] = {
             'github_org': org,
             'github_repo': repo,
             'sha': sha,
             'branch': branch
         }
+    save_branch_cache(repos_key, result)
     return result
 
 def main():
     result = get_default_branches()
-    yaml.dump(result, sys.stdout, default_flow_style=False, indent=2)
+    _yaml.dump(result, sys.stdout, default_flow_style=False, indent=2)
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
@@ -9,15 +9,37 @@ Usage:
 
 import os
 import sys
-import yaml
 import re
+import io
 import subprocess
-import toml
+import tomli_w
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from pathlib import Path
-from typing import Dict, List, Optional, Union
+from typing import Any, Callable, Dict, List, Optional, TextIO, Tuple, Union
+
+try:
+    import tomllib
+except ImportError:
+    # Python < 3.11
+    import tomli as tomllib
 
 # Add the parent directory to sys.path so we can import _crucible modules
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from _crucible._yaml import load_yaml_file
+
+# Maximum number of 'lake update' processes run at once
+MAX_CONCURRENT_LAKE_UPDATES = 8
+
+# Lean package declaration: package <name> where
+PACKAGE_RE = re.compile(r'package\s+([a-zA-Z0-9_]+)\s+where')
+
+# Require statements in Lean lakefiles
+# Matches: require "scope" / "name" @ git "url"
+# or: require <name> from git "<url>" @ "<rev>"
+# or: require <name> from "<path>"
+# etc.
+REQUIRE_RE = re.compile(r'require\s+(?:"[^"]*"\s*/\s+"([^"]+)"|([a-zA-Z0-9_]+))(?:\s+@\s+git\s+"[^"]*"|\s+from\s+git\s+"[^"]*"(?:\s+@\s+"[^"]*")?|\s+from\s+"[^"]*")?')
 
 def load_repositories() -> List[Dict[str, str]]:
     """Load repository configuration from repositories.yml"""
@@ -26,11 +48,19 @@ def load_repositories() -> List[Dict[str, str]]:
         print("Error: repositories.yml not found in _crucible directory", file=sys.stderr)
         sys.exit(1)
     
-    with open(repos_file, 'r') as f:
-        return yaml.safe_load(f)
+    return load_yaml_file(repos_file)
 
 def find_lakefile(repo_dir: Path) -> Optional[Path]:
     """Find lakefile.toml or lakefile.lean in a repository directory"""
+    try:
+        # Adding or removing a lakefile changes the directory's mtime
+        mtime_ns = os.stat(repo_dir).st_mtime_ns
+    except OSError:
+        return None
+    return _find_lakefile_cached(repo_dir, mtime_ns)
+
+@lru_cache(maxsize=256)
+def _find_lakefile_cached(repo_dir: Path, mtime_ns: int) -> Optional[Path]:
     toml_file = repo_dir / "lakefile.toml"
     lean_file = repo_dir / "lakefile.lean"
     
@@ -48,26 +78,38 @@ def get_repository_names() -> Dict[str, str]:
 
 def extract_package_name(lakefile_path: Path) -> Optional[str]:
     """Extract the actual package name from a lakefile"""
+    try:
+        st = os.stat(lakefile_path)
+    except OSError as e:
+        print(f"Warning: Could not extract package name from {lakefile_path}: {e}", file=sys.stderr)
+        return None
+    return _extract_package_name_cached(lakefile_path, st.st_mtime_ns, st.st_size)
+
+@lru_cache(maxsize=256)
+def _extract_package_name_cached(lakefile_path: Path, mtime_ns: int, size: int) -> Optional[str]:
     try:
         if lakefile_path.name == "lakefile.toml":
-            with open(lakefile_path, 'r') as f:
-                data = toml.load(f)
+            with open(lakefile_path, 'rb') as f:
+                data = tomllib.load(f)
             return data.get('name')
         else:  # lakefile.lean
             with open(lakefile_path, 'r') as f:
                 content = f.read()
             # Look for package declaration: package <name> where
-            package_match = re.search(r'package\s+([a-zA-Z0-9_]+)\s+where', content)
+            package_match = PACKAGE_RE.search(content)
             if package_match:
                 return package_match.group(1)
     except Exception as e:
         print(f"Warning: Could not extract package name from {lakefile_path}: {e}", file=sys.stderr)
     return None
 
-def run_lake_update(repo_dir: Path, repo_name: str) -> bool:
-    """Run 'lake update' in a repository directory"""
+def run_lake_update(repo_dir: Path, repo_name: str,
+                    out: Optional[TextIO] = None, err: Optional[TextIO] = None) -> bool:
+    """Run 'lake update' in a repository directory, reporting progress to out and errors to err"""
+    out = out or sys.stdout
+    err = err or sys.stderr
     try:
-        print(f"  Running lake update in {repo_name}...")
+        print(f"  Running lake update in {repo_name}...", file=out)
         result = subprocess.run(
             ["lake", "update"],
             cwd=repo_dir,
@@ -77,24 +119,34 @@ def run_lake_update(repo_dir: Path, repo_name: str) -> bool:
         )
         
         if result.returncode == 0:
-            print(f"  Lake update completed successfully in {repo_name}")
+            print(f"  Lake update completed successfully in {repo_name}", file=out)
             return True
         else:
-            print(f"  Lake update failed in {repo_name}: {result.stderr.strip()}", file=sys.stderr)
+            print(f"  Lake update failed in {repo_name}: {result.stderr.strip()}", file=err)
             return False
             
     except subprocess.TimeoutExpired:
-        print(f"  Lake update timed out in {repo_name}", file=sys.stderr)
+        print(f"  Lake update timed out in {repo_name}", file=err)
         return False
     except Exception as e:
-        print(f"  Error running lake update in {repo_name}: {e}", file=sys.stderr)
+        print(f"  Error running lake update in {repo_name}: {e}", file=err)
         return False
 
-def modify_toml_lakefile(lakefile_path: Path, repo_name_map: Dict[str, str]) -> bool:
+def run_buffered(func: Callable[..., Any], *args: Any) -> Tuple[Any, str, str]:
+    """Call func(*args, out, err) with in-memory output streams, returning its result and their contents"""
+    out = io.StringIO()
+    err = io.StringIO()
+    result = func(*args, out, err)
+    return result, out.getvalue(), err.getvalue()
+
+def modify_toml_lakefile(lakefile_path: Path, repo_name_map: Dict[str, str],
+                         out: Optional[TextIO] = None, err: Optional[TextIO] = None) -> bool:
     """Modify a TOML lakefile to use relative paths for require statements"""
+    out = out or sys.stdout
+    err = err or sys.stderr
     try:
-        with open(lakefile_path, 'r') as f:
-            data = toml.load(f)
+        with open(lakefile_path, 'rb') as f:
+            data = tomllib.load(f)
         
         modified = False
         
@@ -130,33 +182,29 @@ def modify_toml_lakefile(lakefile_path: Path, repo_name_map: Dict[str, str]) ->
                         if require_entry.get('path') != relative_path:
                             require_entry['path'] = relative_path
                             modified = True
-                            print(f"  Updated {req_name} to use path: {relative_path}")
+                            print(f"  Updated {req_name} to use path: {relative_path}", file=out)
         
         if modified:
-            with open(lakefile_path, 'w') as f:
-                toml.dump(data, f)
+            with open(lakefile_path, 'wb') as f:
+                tomli_w.dump(data, f)
         
         return modified
         
     except Exception as e:
-        print(f"Error modifying TOML lakefile {lakefile_path}: {e}", file=sys.stderr)
+        print(f"Error modifying TOML lakefile {lakefile_path}: {e}", file=err)
         return False
 
-def modify_lean_lakefile(lakefile_path: Path, repo_name_map: Dict[str, str]) -> bool:
+def modify_lean_lakefile(lakefile_path: Path, repo_name_map: Dict[str, str],
+                         out: Optional[TextIO] = None, err: Optional[TextIO] = None) -> bool:
     """Modify a Lean lakefile to use relative paths for require statements"""
+    out = out or sys.stdout
+    err = err or sys.stderr
     try:
         with open(lakefile_path, 'r') as f:
             content = f.read()
         
         original_content = content
         
-        # Pattern to match require statements in Lean format
-        # Matches: require "scope" / "name" @ git "url"
-        # or: require <name> from git "<url>" @ "<rev>"
-        # or: require <name> from "<path>"
-        # etc.
-        require_pattern = r'require\s+(?:"[^"]*"\s*/\s+"([^"]+)"|([a-zA-Z0-9_]+))(?:\s+@\s+git\s+"[^"]*"|\s+from\s+git\s+"[^"]*"(?:\s+@\s+"[^"]*")?|\s+from\s+"[^"]*")?'
-        
         def replace_require(match):
             # Group 1: scoped name (e.g., "batteries" from "scope" / "batteries")
             # Group 2: simple name (e.g., mathlib4)
@@ -165,13 +213,13 @@ def modify_lean_lakefile(lakefile_path: Path, repo_name_map: Dict[str, str]) ->
             if req_name in repo_name_map:
                 relative_path = f"../{req_name}"
                 replacement = f'require {req_name} from "{relative_path}"'
-                print(f"  Updated {req_name} to use path: {relative_path}")
+                print(f"  Updated {req_name} to use path: {relative_path}", file=out)
                 return replacement
             else:
                 # Keep the original if it's not a repo we manage
                 return match.group(0)
         
-        content = re.sub(require_pattern, replace_require, content)
+        content = REQUIRE_RE.sub(replace_require, content)
         
         if content != original_content:
             with open(lakefile_path, 'w') as f:
@@ -181,7 +229,7 @@ def modify_lean_lakefile(lakefile_path: Path, repo_name_map: Dict[str, str]) ->
             return False
             
     except Exception as e:
-        print(f"Error modifying Lean lakefile {lakefile_path}: {e}", file=sys.stderr)
+        print(f"Error modifying Lean lakefile {lakefile_path}: {e}", file=err)
         return False
 
 def create_root_lakefile(repo_names: List[str]) -> None:
@@ -198,8 +246,8 @@ def create_root_lakefile(repo_names: List[str]) -> None:
     # Load existing config if it exists
     if root_lakefile.exists():
         try:
-            with open(root_lakefile, 'r') as f:
-                existing_config = toml.load(f)
+            with open(root_lakefile, 'rb') as f:
+                existing_config = tomllib.load(f)
             
             # Preserve existing name and version if they exist
             if 'name' in existing_config:
@@ -232,13 +280,79 @@ def create_root_lakefile(repo_names: List[str]) -> None:
     
     # Write the root lakefile
     try:
-        with open(root_lakefile, 'w') as f:
-            toml.dump(config, f)
+        with open(root_lakefile, 'wb') as f:
+            tomli_w.dump(config, f)
         print(f"\nRoot lakefile.toml created/updated with {len(config['require'])} repositories")
     except Exception as e:
         print(f"Error writing root lakefile: {e}", file=sys.stderr)
         sys.exit(1)
 
+def local_dependencies(lakefile_path: Path, repo_name_map: Dict[str, str]) -> List[str]:
+    """Return the managed repositories a lakefile requires"""
+    try:
+        if lakefile_path.name == "lakefile.toml":
+            with open(lakefile_path, 'rb') as f:
+                data = tomllib.load(f)
+            names = [entry.get('name') for entry in data.get('require', [])]
+        else:  # lakefile.lean
+            with open(lakefile_path, 'r') as f:
+                content = f.read()
+            names = [match.group(1) or match.group(2) for match in REQUIRE_RE.finditer(content)]
+    except Exception as e:
+        print(f"Warning: Could not read requirements from {lakefile_path}: {e}", file=sys.stderr)
+        return []
+    return [name for name in names if name in repo_name_map]
+
+def update_waves(repo_names: List[str], dependencies: Dict[str, List[str]]) -> List[List[str]]:
+    """Group repositories into waves, each after every wave holding something it
+    (directly or transitively) requires, so no wave contains a repository together
+    with one of its dependencies"""
+    depths: Dict[str, int] = {}
+    
+    def depth(name: str, visiting: frozenset) -> int:
+        if name in depths:
+            return depths[name]
+        if name in visiting:
+            # Dependency cycle; Lake rejects these itself
+            return 0
+        deps = dependencies.get(name, [])
+        depths[name] = 1 + max((depth(dep, visiting | {name}) for dep in deps), default=-1)
+        return depths[name]
+    
+    waves: Dict[int, List[str]] = {}
+    for name in repo_names:
+        waves.setdefault(depth(name, frozenset()), []).append(name)
+    return [waves[level] for level in sorted(waves)]
+
+def process_repo(repo_name: str, repo_name_map: Dict[str, str],
+                 out: TextIO, err: TextIO) -> Tuple[Optional[Path], bool]:
+    """Modify one repository's lakefile, returning the lakefile path and whether it was modified"""
+    repo_dir = Path(repo_name)
+    
+    if not repo_dir.exists():
+        print(f"Repository {repo_name}: directory not found (run 'crucible checkout' first)", file=out)
+        return None, False
+    
+    lakefile_path = find_lakefile(repo_dir)
+    if not lakefile_path:
+        print(f"Repository {repo_name}: no lakefile.toml or lakefile.lean found", file=out)
+        return None, False
+    
+    print(f"Repository {repo_name}: processing {lakefile_path.name}", file=out)
+    
+    # Modify the lakefile based on its type
+    if lakefile_path.name == "lakefile.toml":
+        modified = modify_toml_lakefile(lakefile_path, repo_name_map, out, err)
+    else:  # lakefile.lean
+        modified = modify_lean_lakefile(lakefile_path, repo_name_map, out, err)
+    
+    if modified:
+        print(f"  Modified {lakefile_path}", file=out)
+    else:
+        print(f"  No changes needed for {lakefile_path}", file=out)
+    print(file=out)
+    return lakefile_path, modified
+
 def main():
     """Main function to modify all lakefiles"""
     print("Crucible Lakefile Modifier")
@@ -254,36 +368,39 @@ def main():
         print(f"  - {repo['name']}")
     print()
     
-    # Process each repository
+    # Process each repository. Every repository has its own lakefile, so they are
+    # processed concurrently, printing the output of each one in turn
     total_modified = 0
-    for repo in repos:
-        repo_name = repo['name']
-        repo_dir = Path(repo_name)
-        
-        if not repo_dir.exists():
-            print(f"Repository {repo_name}: directory not found (run 'crucible checkout' first)")
-            continue
-        
-        lakefile_path = find_lakefile(repo_dir)
-        if not lakefile_path:
-            print(f"Repository {repo_name}: no lakefile.toml or lakefile.lean found")
-            continue
-        
-        print(f"Repository {repo_name}: processing {lakefile_path.name}")
-        
-        # Modify the lakefile based on its type
-        if lakefile_path.name == "lakefile.toml":
-            modified = modify_toml_lakefile(lakefile_path, repo_name_map)
-        else:  # lakefile.lean
-            modified = modify_lean_lakefile(lakefile_path, repo_name_map)
-        
-        if modified:
-            total_modified += 1
-            print(f"  Modified {lakefile_path}")
-            # Run lake update after modifying the lakefile
-            run_lake_update(repo_dir, repo_name)
-        else:
-            print(f"  No changes needed for {lakefile_path}")
+    to_update = []
+    dependencies = {}
+    with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+        results = executor.map(
+            lambda repo_name: run_buffered(process_repo, repo_name, repo_name_map),
+            repo_names)
+        for repo_name, ((lakefile_path, modified), out, err) in zip(repo_names, results):
+            sys.stdout.write(out)
+            sys.stdout.flush()
+            sys.stderr.write(err)
+            if lakefile_path:
+                dependencies[repo_name] = local_dependencies(lakefile_path, repo_name_map)
+            if modified:
+                total_modified += 1
+                # Run lake update after modifying the lakefile
+                to_update.append(repo_name)
+    
+    # lake update reads the local repositories a lakefile requires, so a repository
+    # is only updated once everything it depends on has been. Repositories within a
+    # wave are independent of each other and are updated concurrently, printing the
+    # output of each one in turn once it has finished
+    if to_update:
+        print(f"Running lake update in {len(to_update)} repositories...")
+        for wave in update_waves(to_update, dependencies):
+            with ThreadPoolExecutor(max_workers=min(MAX_CONCURRENT_LAKE_UPDATES, len(wave))) as executor:
+                results = executor.map(lambda repo_name: run_buffered(run_lake_update, Path(repo_name), repo_name), wave)
+                for success, out, err in results:
+                    sys.stdout.write(out)
+                    sys.stdout.flush()
+                    sys.stderr.write(err)
         print()
     
     # Create root lakefile